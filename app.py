@@ -4,13 +4,15 @@ import logging
 import requests
 import json
 import base64
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, g
 from werkzeug.utils import secure_filename
 import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
 import tempfile
+import threading
+import uuid
 import wave
 import audioop
 from pydub import AudioSegment
@@ -24,6 +26,19 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from datetime import datetime
+from config import OLLAMA_CONFIG, SECURITY_CONFIG, SPEECH_CONFIG, TRACING_CONFIG, UI_CONFIG
+from audio_stream import ENGINES, AudioStreamSessions, engine_language_options
+from latex_render import render_math_segments
+from ollama_manager import ModelLifecycleManager, fetch_running_models
+from ollama_router import OllamaRouter
+from rate_limiter import (
+    AdmissionController, MemoryBucketStore, RateLimiter, SQLiteBucketStore, retry_after_header
+)
+from tracing import Tracer
+from token_budget import (
+    STOP_SEQUENCES, SOLVE_STOP_MARKER, PRACTICE_STOP_MARKER, TokenUsageRecorder,
+    estimate_complexity, get_token_budget, strip_stop_marker
+)
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -48,9 +63,83 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 PDF_OUTPUT_FOLDER = 'pdf_output'
 os.makedirs(PDF_OUTPUT_FOLDER, exist_ok=True)
 
-# Ollama API configuration - Only local instance supported
-OLLAMA_API_URL = 'http://localhost:11434'  # Fixed to localhost only
-OLLAMA_MODEL = 'gemma3:4b'  # Fixed to Gemma 3 4B model
+# Ollama API configuration - one or more local instances
+OLLAMA_ENDPOINTS = OLLAMA_CONFIG.get("endpoints") or ['http://localhost:11434']
+OLLAMA_API_URL = OLLAMA_ENDPOINTS[0]
+OLLAMA_MODEL = OLLAMA_CONFIG.get("model", "gemma3:4b")  # Default Gemma 3 4B model
+OLLAMA_KEEP_ALIVE = OLLAMA_CONFIG.get("keep_alive", "30m")
+
+# Route each request to the least-loaded healthy Ollama instance
+ollama_router = OllamaRouter(
+    OLLAMA_ENDPOINTS,
+    OLLAMA_CONFIG.get("mode_models", {}),
+    OLLAMA_MODEL,
+    max_failures=OLLAMA_CONFIG.get("max_failures", 3),
+    eject_seconds=OLLAMA_CONFIG.get("eject_seconds", 30)
+)
+
+# Keep every model resident on every instance so the first request after idle skips the load
+model_managers = [
+    ModelLifecycleManager(
+        endpoint,
+        model,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        ping_interval=OLLAMA_CONFIG.get("keep_warm_interval", 240),
+        active_hours=OLLAMA_CONFIG.get("keep_warm_hours")
+    )
+    for endpoint in OLLAMA_ENDPOINTS
+    for model in ollama_router.models()
+]
+
+_model_managers_started = False
+_model_managers_lock = threading.Lock()
+
+def start_model_managers():
+    """Start preloading and keep-warm pings once per worker process"""
+    global _model_managers_started
+    if not OLLAMA_CONFIG.get("keep_warm", True):
+        return
+    with _model_managers_lock:
+        if _model_managers_started:
+            return
+        _model_managers_started = True
+    for manager in model_managers:
+        manager.start(preload=OLLAMA_CONFIG.get("preload_on_startup", True))
+
+# Per-mode/complexity generation budgets and the actual usage they are tuned from
+OLLAMA_TOKEN_BUDGETS = OLLAMA_CONFIG.get("token_budgets", {})
+token_usage = TokenUsageRecorder(OLLAMA_CONFIG.get("token_usage_log"))
+
+# Per-request stage timing
+tracer = Tracer(
+    sample_rate=TRACING_CONFIG.get("sample_rate", 1.0),
+    export_path=TRACING_CONFIG.get("export_path"),
+    service_name=TRACING_CONFIG.get("service_name", "equalearn.ai")
+)
+
+# Streaming voice input sessions
+audio_sessions = AudioStreamSessions(SPEECH_CONFIG)
+
+# Rate limiting and admission control
+EXPENSIVE_ENDPOINTS = {'solve_text', 'generate_practice', 'solve_image', 'stream_audio_start'}
+ADMISSION_POOLS = {'solve_text': 'ollama', 'generate_practice': 'ollama', 'solve_image': 'cpu'}
+# Audio chunks arrive several times a second; the session itself is rate limited at start
+UNLIMITED_ENDPOINTS = {'static', 'static_files', 'health_check', 'stream_audio_chunk', 'stream_audio_finish'}
+
+if SECURITY_CONFIG.get("rate_limit_store") == "sqlite":
+    rate_limit_store = SQLiteBucketStore(SECURITY_CONFIG.get("rate_limit_db", "rate_limits.db"))
+else:
+    rate_limit_store = MemoryBucketStore()
+
+rate_limiter = RateLimiter(rate_limit_store, {
+    "cheap": (SECURITY_CONFIG.get("max_requests_per_minute", 60), SECURITY_CONFIG.get("burst_requests", 20)),
+    "expensive": (SECURITY_CONFIG.get("max_expensive_requests_per_minute", 6), SECURITY_CONFIG.get("expensive_burst_requests", 3))
+})
+
+admission = AdmissionController({
+    "ollama": SECURITY_CONFIG.get("max_ollama_queue", 16),
+    "cpu": SECURITY_CONFIG.get("max_cpu_jobs", 4)
+})
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
@@ -292,10 +381,12 @@ def process_audio_file(audio_file):
             audio.export(wav_path, format='wav')
             
             # Use speech recognition
+            engine = SPEECH_CONFIG.get("file_engine", "google")
+            options = {**engine_language_options(engine, 'en-US'), **SPEECH_CONFIG.get("file_engine_options", {})}  # English only
             recognizer = sr.Recognizer()
             with sr.AudioFile(wav_path) as source:
                 audio_data = recognizer.record(source)
-                text = recognizer.recognize_google(audio_data, language='en-US')  # English only
+                text = getattr(recognizer, ENGINES[engine])(audio_data, **options)
                 if not text.strip():
                     return "No speech detected in audio file. Please ensure the audio contains clear speech."
                 return text
@@ -315,6 +406,31 @@ def process_audio_file(audio_file):
         logger.error(f"Error processing audio: {e}")
         return f"ERROR: Failed to process audio: {str(e)}"
 
+def trace_ollama_durations(span, result):
+    """
+    Break the Ollama span down using the durations Ollama reports (in nanoseconds).
+    Load, prompt evaluation and generation run back to back at the end of the
+    request; whatever is left of the span was spent queueing or in transit.
+    """
+    trace = tracer.current()
+    if trace is None or span is None:
+        return
+    
+    cursor = span.end_ns
+    for name, key in (("ollama.eval", "eval_duration"),
+                      ("ollama.prompt_eval", "prompt_eval_duration"),
+                      ("ollama.load", "load_duration")):
+        # Clamp so reported durations never reach back before the request was sent
+        duration = min(result.get(key) or 0, cursor - span.start_ns)
+        if duration > 0:
+            cursor -= duration
+            trace.add_span(name, cursor, duration, parent=span)
+    
+    queued = cursor - span.start_ns
+    if result.get("total_duration") and queued > 0:
+        trace.add_span("ollama.queue", span.start_ns, queued, parent=span)
+    span.attributes["eval_count"] = result.get("eval_count") or 0
+
 def call_ollama_api(text, mode="solve"):
     """
     Call the local Ollama API with different modes:
@@ -322,6 +438,9 @@ def call_ollama_api(text, mode="solve"):
     - practice: Generate practice problems
     """
     try:
+        complexity = estimate_complexity(text)
+        num_predict = get_token_budget(OLLAMA_TOKEN_BUDGETS, mode, complexity, OLLAMA_CONFIG.get("max_tokens", 2048))
+        
         if mode == "solve":
             # Enhanced prompt for detailed step-by-step solutions
             enhanced_prompt = f"""You are a professional mathematics teacher. Please solve this math problem step by step with the following requirements:
@@ -330,7 +449,8 @@ def call_ollama_api(text, mode="solve"):
 2. Provide detailed step-by-step explanations with clear reasoning
 3. Use \\begin{{align}} and \\end{{align}} to wrap multi-line mathematical expressions
 4. Add clear explanations for each key step
-5. Provide a clear final answer
+5. Provide a clear final answer on a line starting with **Final Answer:**
+6. Immediately after the final answer, write {SOLVE_STOP_MARKER} on its own line and stop
 
 Math Problem: {text}
 
@@ -376,34 +496,49 @@ IMPORTANT: Use simple LaTeX format for mathematical expressions. For example:
 - Use int f(x) dx for integrals
 - Use d/dx for derivatives
 
+After the solution for Problem 10, write {PRACTICE_STOP_MARKER} on its own line and stop.
+
 Original Problem: {text}
 
 Please generate 10 calculation problems with detailed solutions:"""
         
-        response = requests.post(
-            f"{OLLAMA_API_URL}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": enhanced_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1 if mode == "solve" else 0.3,
-                    "top_p": 0.9,
-                    "num_predict": 2048
-                }
-            },
-            timeout=300  # Increased timeout for complex problems
-        )
+        with tracer.span("ollama", mode=mode, complexity=complexity) as ollama_span:
+            response = ollama_router.post(
+                "/api/generate",
+                {
+                    "model": ollama_router.model_for(mode),
+                    "prompt": enhanced_prompt,
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    "options": {
+                        "temperature": 0.1 if mode == "solve" else 0.3,
+                        "top_p": 0.9,
+                        "num_predict": num_predict,
+                        "stop": STOP_SEQUENCES.get(mode, [])
+                    }
+                },
+                timeout=300  # Increased timeout for complex problems
+            )
         
         if response.status_code == 200:
             result = response.json()
-            latex_response = result.get("response", "").strip()
+            trace_ollama_durations(ollama_span, result)
+            latex_response = strip_stop_marker(result.get("response", ""), mode)
+            usage = token_usage.record(mode, complexity, num_predict, result)
+            logger.info(f"Ollama {mode} ({complexity}): {usage['eval_count']}/{num_predict} tokens, done_reason={usage['done_reason']}")
+            
+            # done_reason "length" means num_predict cut the answer off mid-way
+            truncated = usage["done_reason"] == "length"
+            if truncated:
+                logger.warning(f"Ollama {mode} response truncated at the {num_predict}-token budget ({complexity} problem); "
+                               f"raise token_budgets['{mode}']['{complexity}'] if this recurs")
             
             if latex_response:
                 return {
                     "success": True,
                     "latex": latex_response,
-                    "source": "ollama"
+                    "source": "ollama",
+                    "truncated": truncated
                 }
             else:
                 return {"success": False, "error": "Ollama returned empty response"}
@@ -421,10 +556,107 @@ Please generate 10 calculation problems with detailed solutions:"""
         logger.error(f"Ollama API error: {str(e)}")
         return {"success": False, "error": f"Ollama error: {str(e)}"}
 
+@app.before_request
+def ensure_model_managers():
+    """Start the keep-warm threads in whichever process serves requests (dev server or WSGI worker)"""
+    start_model_managers()
+
+def timing_requested():
+    """Whether the client asked for the JSON timing block"""
+    return request.args.get('timing') == '1' or request.headers.get('X-Timing') == '1'
+
+@app.before_request
+def start_trace():
+    """Assign a request id and start timing the request"""
+    if not TRACING_CONFIG.get("enabled", True):
+        return None
+    # Accept a caller-supplied id so logs can be correlated across services
+    request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex[:16]
+    g.trace, g.trace_token = tracer.start(request.endpoint or request.path, request_id,
+                                          force_sample=timing_requested())
+    return None
+
+@app.after_request
+def finish_trace(response):
+    """Attach Server-Timing, the request id and, on request, a JSON timing block"""
+    trace = g.pop('trace', None)
+    if trace is None:
+        return response
+    
+    trace.finish(**{"http.method": request.method, "http.route": request.path, "http.status_code": response.status_code})
+    response.headers['X-Request-ID'] = trace.request_id
+    if trace.sampled:
+        response.headers['Server-Timing'] = trace.server_timing()
+        if timing_requested() and response.is_json:
+            payload = response.get_json()
+            if isinstance(payload, dict):
+                payload["timing"] = trace.to_dict()
+                response.set_data(json.dumps(payload))
+        tracer.export(trace)
+    return response
+
+@app.teardown_request
+def end_trace(exception=None):
+    """Detach the trace from the request context"""
+    g.pop('trace', None)
+    token = g.pop('trace_token', None)
+    if token is not None:
+        tracer.end(token)
+
+def get_client_id():
+    """Identify the client for rate limiting"""
+    if SECURITY_CONFIG.get("trust_forwarded_for"):
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            # Clients can put anything at the front; the last hop is the one our proxy appended
+            return forwarded.split(',')[-1].strip()
+    return request.remote_addr or 'unknown'
+
+def too_many_requests(message, retry_after):
+    """Build a 429 response with a Retry-After header"""
+    response = jsonify({
+        "success": False,
+        "error": message
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+@app.before_request
+def enforce_limits():
+    """Apply per-client rate limits, then admit expensive work only while there is capacity"""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    
+    if SECURITY_CONFIG.get("enable_rate_limiting"):
+        endpoint_class = "expensive" if endpoint in EXPENSIVE_ENDPOINTS else "cheap"
+        allowed, retry_after = rate_limiter.check(get_client_id(), endpoint_class)
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {get_client_id()} on {endpoint}")
+            return too_many_requests("Too many requests. Please wait a moment and try again.", retry_after)
+    
+    pool = ADMISSION_POOLS.get(endpoint)
+    if pool and SECURITY_CONFIG.get("enable_admission_control", True):
+        if not admission.try_acquire(pool):
+            logger.warning(f"Shedding {endpoint}: {pool} pool saturated")
+            return too_many_requests("The server is busy right now. Please try again shortly.",
+                                     SECURITY_CONFIG.get("shed_retry_after", 5))
+        g.admission_pool = pool
+    return None
+
+@app.teardown_request
+def release_admission(exception=None):
+    """Free the admission slot taken in enforce_limits"""
+    pool = g.pop('admission_pool', None)
+    if pool:
+        admission.release(pool)
+
 @app.route('/')
 def home():
     """Serve the main application page"""
-    return render_template('index.html')
+    katex_local = os.path.exists(os.path.join(UI_CONFIG.get("katex_local_dir", "static/katex"), "katex.min.js"))
+    return render_template('index.html', katex_local=katex_local)
 
 @app.route('/debug')
 def debug():
@@ -475,8 +707,10 @@ def solve_text():
             return jsonify({
                 "success": True,
                 "latex": ollama_result["latex"],
+                "rendered_math": render_math_segments(ollama_result["latex"]) if UI_CONFIG.get("server_side_math") else {},
                 "original_text": text,
                 "source": "ollama",
+                "truncated": ollama_result.get("truncated", False),
                 "message": "Solution generated by local Ollama + Gemma 3n model"
             })
         else:
@@ -517,10 +751,12 @@ def generate_practice():
             logger.info("Successfully generated practice problems using local Ollama + Gemma 3n")
             
             # Parse the AI response to extract problems and solutions
-            calculation, answers = parse_practice_problems_and_solutions(ollama_result["latex"])
+            with tracer.span("parse_practice"):
+                calculation, answers = parse_practice_problems_and_solutions(ollama_result["latex"])
             
             # Generate PDF
-            pdf_filename = generate_practice_pdf(text, calculation, answers)
+            with tracer.span("pdf"):
+                pdf_filename = generate_practice_pdf(text, calculation, answers)
             
             if pdf_filename:
                 return jsonify({
@@ -580,7 +816,8 @@ def solve_image():
         logger.info(f"Processing file: {file.filename}")
         
         # Read file data
-        file_data = file.read()
+        with tracer.span("read_file"):
+            file_data = file.read()
         if len(file_data) == 0:
             return jsonify({
                 "success": False,
@@ -594,7 +831,8 @@ def solve_image():
         if file_extension in ['wav', 'mp3', 'm4a', 'ogg']:
             # Audio file - speech recognition
             file.seek(0)  # Reset file pointer
-            extracted_text = process_audio_file(file)
+            with tracer.span("speech"):
+                extracted_text = process_audio_file(file)
             
         elif file_extension in ['mp4', 'avi', 'mov', 'wmv', 'webm']:
             # Video file - extract frames and OCR
@@ -603,7 +841,8 @@ def solve_image():
                 temp_path = temp_file.name
             
             try:
-                extracted_text = extract_text_from_video(temp_path)
+                with tracer.span("video_ocr"):
+                    extracted_text = extract_text_from_video(temp_path)
             finally:
                 if os.path.exists(temp_path):
                     os.unlink(temp_path)
@@ -625,7 +864,8 @@ def solve_image():
                 if image.mode != 'RGB':
                     image = image.convert('RGB')
                 
-                extracted_text = pytesseract.image_to_string(image, lang='eng')
+                with tracer.span("ocr"):
+                    extracted_text = pytesseract.image_to_string(image, lang='eng')
                 extracted_text = extracted_text.strip()
                 
             except Exception as e:
@@ -666,27 +906,108 @@ def solve_image():
             "error": "An unexpected error occurred while processing the file"
         }), 500
 
+@app.route('/stream_audio/start', methods=['POST'])
+def stream_audio_start():
+    """
+    Open a streaming voice input session.
+    The client then POSTs raw 16-bit mono PCM chunks at the returned sample rate.
+    """
+    session_id, transcriber = audio_sessions.create()
+    if session_id is None:
+        return jsonify({
+            "success": False,
+            "error": "Too many voice input sessions in progress. Please try again shortly."
+        }), 503
+    
+    return jsonify({
+        "success": True,
+        "session_id": session_id,
+        "sample_rate": transcriber.sample_rate
+    })
+
+@app.route('/stream_audio/<session_id>/chunk', methods=['POST'])
+def stream_audio_chunk(session_id):
+    """Add a chunk of audio and return the text transcribed so far"""
+    transcriber = audio_sessions.get(session_id)
+    if transcriber is None:
+        return jsonify({
+            "success": False,
+            "error": "Voice input session not found or expired"
+        }), 404
+    
+    chunk = request.get_data()
+    if len(chunk) % 2:
+        return jsonify({
+            "success": False,
+            "error": "Audio chunks must be 16-bit PCM"
+        }), 400
+    
+    try:
+        transcriber.feed(chunk)
+    except ValueError as e:
+        audio_sessions.close(session_id)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    if transcriber.error:
+        # The client stops streaming on an error and never calls /finish
+        audio_sessions.close(session_id)
+        return jsonify({
+            "success": False,
+            "error": transcriber.error
+        }), 500
+    
+    return jsonify({
+        "success": True,
+        "partial_text": transcriber.partial_text()
+    })
+
+@app.route('/stream_audio/<session_id>/finish', methods=['POST'])
+def stream_audio_finish(session_id):
+    """Close the session and return the complete transcription"""
+    transcriber = audio_sessions.close(session_id)
+    if transcriber is None:
+        return jsonify({
+            "success": False,
+            "error": "Voice input session not found or expired"
+        }), 404
+    
+    text = transcriber.finish(timeout=SPEECH_CONFIG.get("timeout", 10) * 6)
+    if transcriber.error:
+        return jsonify({
+            "success": False,
+            "error": transcriber.error
+        }), 500
+    
+    return jsonify({
+        "success": True,
+        "text": text,
+        "message": "Speech transcribed" if text else "No speech detected. Please speak clearly and try again."
+    })
+
 @app.route('/test_ollama_connection', methods=['POST'])
 def test_ollama_connection():
-    """Test connection to local Ollama instance"""
+    """Test connection to the primary Ollama instance (see /ollama_status for all instances)"""
     try:
-        # Only test localhost connection
         response = requests.get(f"{OLLAMA_API_URL}/api/tags", timeout=10)
         
         if response.status_code == 200:
             models_data = response.json()
             models = [model.get('name', 'unknown') for model in models_data.get('models', [])]
+            missing = [model for model in ollama_router.models() if model not in models]
             
-            if 'gemma3:4b' in models:
+            if not missing:
                 return jsonify({
                     "success": True,
-                    "message": "Local Ollama connected successfully, Gemma 3 4B model available",
+                    "message": f"Local Ollama connected successfully, {', '.join(ollama_router.models())} available",
                     "models": models
                 })
             else:
                 return jsonify({
                     "success": False,
-                    "error": f"Local Ollama connected but Gemma 3 4B model not found. Please run: ollama pull gemma3:4b\nAvailable models: {', '.join(models) if models else 'None'}"
+                    "error": f"Local Ollama connected but {', '.join(missing)} not found. Please run: ollama pull {missing[0]}\nAvailable models: {', '.join(models) if models else 'None'}"
                 })
         else:
             return jsonify({
@@ -710,6 +1031,33 @@ def test_ollama_connection():
             "error": f"Connection error: {str(e)}"
         })
 
+@app.route('/ollama_status')
+def ollama_status():
+    """Report model load state, last load time and endpoint load"""
+    # One /api/ps call per endpoint, shared by every model on it
+    running_by_endpoint = {}
+    for endpoint in OLLAMA_ENDPOINTS:
+        try:
+            running_by_endpoint[endpoint] = fetch_running_models(endpoint)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Could not read loaded models from {endpoint}: {e}")
+            # An unreachable endpoint cannot serve any model
+            running_by_endpoint[endpoint] = []
+    
+    return jsonify({
+        "models": [manager.status(running_by_endpoint.get(manager.api_url)) for manager in model_managers],
+        "router": ollama_router.status(),
+        "admission": admission.status()
+    })
+
+@app.route('/token_usage')
+def token_usage_summary():
+    """Report generated token counts per mode and complexity against their budgets"""
+    return jsonify({
+        "budgets": OLLAMA_TOKEN_BUDGETS,
+        "usage": token_usage.summary()
+    })
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
@@ -730,4 +1078,8 @@ def download_pdf(filename):
         return jsonify({"error": "File not found"}), 404
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    debug_mode = True
+    # With the debug reloader only the child process serves requests
+    if not debug_mode or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_model_managers()
+    app.run(host="0.0.0.0", port=8080, debug=debug_mode)
\ No newline at end of file
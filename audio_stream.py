@@ -0,0 +1,250 @@
+"""
+equalearn.ai. Streaming voice input
+Accepts microphone audio in small PCM chunks, splits it into utterances with
+an energy-based voice activity detector and transcribes each utterance with
+a local speech engine while the student is still speaking.
+"""
+
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_WIDTH = 2  # 16-bit little-endian mono PCM
+FRAME_MS = 30
+PREROLL_MS = 300
+
+# speech_recognition method used for each engine; sphinx, vosk and whisper run locally
+ENGINES = {
+    "sphinx": "recognize_sphinx",
+    "vosk": "recognize_vosk",
+    "whisper": "recognize_whisper",
+    "faster_whisper": "recognize_faster_whisper",
+    "google": "recognize_google"
+}
+
+
+def engine_language_options(engine, language):
+    """
+    Translate a BCP-47 tag like "en-US" into the language argument each engine expects.
+    sphinx and google take the full tag, whisper models take the bare code ("en"),
+    and vosk takes no language because it is fixed by the downloaded model.
+    """
+    if not language or engine == "vosk":
+        return {}
+    if engine in ("whisper", "faster_whisper"):
+        return {"language": language.split('-')[0].lower()}
+    return {"language": language}
+
+
+def frame_energy(frame):
+    """Root-mean-square amplitude of a PCM16 frame"""
+    samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+    if samples.size == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples * samples)))
+
+
+class SpeechEngine:
+    """Thin wrapper that calls the configured speech_recognition engine"""
+
+    def __init__(self, engine="sphinx", language="en-US", options=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown speech engine: {engine}")
+        self.engine = engine
+        # Explicit engine options win over the translated language
+        self.options = {**engine_language_options(engine, language), **(options or {})}
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, pcm, sample_rate):
+        """Transcribe one utterance; returns an empty string when nothing was understood"""
+        audio_data = sr.AudioData(bytes(pcm), sample_rate, SAMPLE_WIDTH)
+        try:
+            text = getattr(self.recognizer, ENGINES[self.engine])(audio_data, **self.options)
+        except sr.UnknownValueError:
+            return ""
+        # Older vosk integrations return the raw JSON result
+        if isinstance(text, str) and text.startswith('{'):
+            try:
+                text = json.loads(text).get("text", "")
+            except ValueError:
+                pass
+        return text.strip() if isinstance(text, str) else ""
+
+
+class StreamingTranscriber:
+    """Voice activity detection and incremental transcription for one recording"""
+
+    def __init__(self, engine, executor, sample_rate=16000, energy_threshold=300,
+                 silence_ms=600, min_speech_ms=250, max_segment_seconds=10, max_seconds=120):
+        self.engine = engine
+        self.executor = executor
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.frame_bytes = int(sample_rate * FRAME_MS / 1000) * SAMPLE_WIDTH
+        self.silence_frames = max(1, silence_ms // FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self.max_segment_bytes = int(max_segment_seconds * sample_rate) * SAMPLE_WIDTH
+        self.max_bytes = int(max_seconds * sample_rate) * SAMPLE_WIDTH
+
+        self._pending = b""
+        self._preroll = deque(maxlen=max(1, PREROLL_MS // FRAME_MS))
+        self._segment = bytearray()
+        self._speech_frames = 0
+        self._silent_run = 0
+        self._in_speech = False
+        self._futures = []
+        self._lock = threading.Lock()
+
+        self.received_bytes = 0
+        self.last_activity = time.monotonic()
+        self.error = None
+
+    def feed(self, chunk):
+        """Add a chunk of PCM16 audio; completed utterances are queued for transcription"""
+        with self._lock:
+            self.last_activity = time.monotonic()
+            if self.received_bytes + len(chunk) > self.max_bytes:
+                raise ValueError("Recording is too long")
+            self.received_bytes += len(chunk)
+
+            data = self._pending + chunk
+            usable = len(data) - len(data) % self.frame_bytes
+            self._pending = data[usable:]
+
+            for offset in range(0, usable, self.frame_bytes):
+                self._process_frame(data[offset:offset + self.frame_bytes])
+
+    def _process_frame(self, frame):
+        is_speech = frame_energy(frame) >= self.energy_threshold
+
+        if not self._in_speech:
+            if is_speech:
+                self._in_speech = True
+                self._segment = bytearray(b"".join(self._preroll))
+                self._segment += frame
+                self._speech_frames = 1
+                self._silent_run = 0
+                self._preroll.clear()
+            else:
+                self._preroll.append(frame)
+            return
+
+        self._segment += frame
+        if is_speech:
+            self._speech_frames += 1
+            self._silent_run = 0
+        else:
+            self._silent_run += 1
+
+        if self._silent_run >= self.silence_frames or len(self._segment) >= self.max_segment_bytes:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._speech_frames >= self.min_speech_frames:
+            segment = bytes(self._segment)
+            self._futures.append(self.executor.submit(self._transcribe, segment))
+        self._segment = bytearray()
+        self._speech_frames = 0
+        self._silent_run = 0
+        self._in_speech = False
+
+    def _transcribe(self, segment):
+        try:
+            return self.engine.transcribe(segment, self.sample_rate)
+        except Exception as e:
+            # Missing engine packages surface as RequestError or ImportError
+            self.error = f"Speech recognition failed: {e}"
+            logger.error(self.error)
+            return ""
+
+    def partial_text(self):
+        """Text of every utterance transcribed so far, in order, stopping at the first one still running"""
+        with self._lock:
+            futures = list(self._futures)
+        texts = []
+        for future in futures:
+            if not future.done():
+                break
+            texts.append(future.result())
+        return " ".join(text for text in texts if text)
+
+    def finish(self, timeout=60):
+        """Flush the utterance in progress and wait up to `timeout` seconds in total for every transcription"""
+        with self._lock:
+            if self._in_speech:
+                self._close_segment()
+            futures = list(self._futures)
+        deadline = time.monotonic() + timeout
+        texts = []
+        for index, future in enumerate(futures):
+            try:
+                texts.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                self.error = "Speech recognition timed out"
+                # Free the workers from utterances nobody will read
+                for pending in futures[index:]:
+                    pending.cancel()
+                break
+        return " ".join(text for text in texts if text)
+
+
+class AudioStreamSessions:
+    """Open streaming sessions, keyed by a random id, with idle expiry"""
+
+    def __init__(self, speech_config):
+        self.config = speech_config
+        self.engine = SpeechEngine(
+            speech_config.get("stream_engine", "sphinx"),
+            speech_config.get("stream_language", "en-US"),
+            speech_config.get("stream_engine_options", {})
+        )
+        self.executor = ThreadPoolExecutor(max_workers=speech_config.get("stream_workers", 2),
+                                           thread_name_prefix="audio-stream")
+        self.idle_timeout = speech_config.get("stream_idle_timeout", 60)
+        self.max_sessions = speech_config.get("stream_max_sessions", 20)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        """Open a new session; returns (session_id, transcriber) or (None, None) when full"""
+        self.purge_idle()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                return None, None
+            session_id = uuid.uuid4().hex
+            transcriber = StreamingTranscriber(
+                self.engine,
+                self.executor,
+                sample_rate=self.config.get("stream_sample_rate", 16000),
+                energy_threshold=self.config.get("vad_energy_threshold", 300),
+                silence_ms=self.config.get("vad_silence_ms", 600),
+                min_speech_ms=self.config.get("vad_min_speech_ms", 250),
+                max_segment_seconds=self.config.get("vad_max_segment_seconds", 10),
+                max_seconds=self.config.get("stream_max_seconds", 120)
+            )
+            self._sessions[session_id] = transcriber
+            return session_id, transcriber
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def purge_idle(self):
+        """Drop sessions the client abandoned"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            for session_id in [sid for sid, t in self._sessions.items() if t.last_activity < cutoff]:
+                del self._sessions[session_id]
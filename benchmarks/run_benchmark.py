@@ -0,0 +1,344 @@
+"""
+equalearn.ai. Load-test and benchmark harness
+Starts a stub Ollama server and the Flask app on local ports, drives
+/solve_text, /generate_practice and /solve_image (image, video and audio
+samples) at the requested concurrency, and writes throughput and latency
+percentiles per endpoint and per stage as JSON.
+
+Runs fully offline:
+    python benchmarks/run_benchmark.py --requests 50 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from stub_ollama import StubOllamaConfig, start_stub_server
+
+SAMPLE_PROBLEMS = [
+    "12 + 7 * 3",
+    "Solve 2x + 3 = 11",
+    "Find the integral of x^2 from 0 to 3",
+    "A rectangle has a perimeter of 24 cm and a length of 8 cm. What is its area?"
+]
+
+SPOKEN_PROBLEM = "Solve two x plus three equals eleven"
+
+ALL_SCENARIOS = ["solve_text", "generate_practice", "solve_image:image", "solve_image:video", "solve_image:audio"]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    """Latency summary in milliseconds"""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 2),
+        "p50_ms": round(percentile(ordered, 0.50), 2),
+        "p95_ms": round(percentile(ordered, 0.95), 2),
+        "p99_ms": round(percentile(ordered, 0.99), 2),
+        "max_ms": round(ordered[-1], 2)
+    }
+
+
+def parse_server_timing(header):
+    """Parse a Server-Timing header into {stage: milliseconds}"""
+    stages = {}
+    if not header:
+        return stages
+    for metric in header.split(','):
+        parts = [part.strip() for part in metric.split(';')]
+        name = parts[0]
+        for param in parts[1:]:
+            if param.startswith('dur='):
+                try:
+                    stages[name] = stages.get(name, 0.0) + float(param[4:])
+                except ValueError:
+                    pass
+    return stages
+
+
+def create_sample_media(directory):
+    """Write a sample image, video and audio file with a math problem in them"""
+    import cv2
+    from PIL import Image, ImageDraw
+
+    samples = {}
+
+    image_path = os.path.join(directory, "sample.png")
+    image = Image.new('RGB', (640, 160), 'white')
+    ImageDraw.Draw(image).text((20, 60), "Solve 2x + 3 = 11", fill='black')
+    image.save(image_path)
+    samples["image"] = image_path
+
+    video_path = os.path.join(directory, "sample.mp4")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (640, 160))
+    for _ in range(90):
+        frame = np.full((160, 640, 3), 255, dtype=np.uint8)
+        cv2.putText(frame, "Solve 2x + 3 = 11", (20, 90), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+        writer.write(frame)
+    writer.release()
+    samples["video"] = video_path
+
+    audio_path = os.path.join(directory, "sample.wav")
+    samples["audio_kind"] = synthesize_speech(audio_path, SPOKEN_PROBLEM)
+    if samples["audio_kind"] is None:
+        # No offline TTS: a tone only exercises the "no speech" error path
+        print("espeak-ng/espeak not found; solve_image:audio will only measure the error path", file=sys.stderr)
+        rate = 16000
+        tone = (0.3 * np.sin(2 * np.pi * 440 * np.arange(rate * 2) / rate) * 32767).astype(np.int16)
+        with wave.open(audio_path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(rate)
+            wav_file.writeframes(tone.tobytes())
+        samples["audio_kind"] = "tone"
+    samples["audio"] = audio_path
+
+    return samples
+
+
+def synthesize_speech(path, text):
+    """Write spoken `text` to a WAV file with an offline TTS; returns the tool used or None"""
+    for tool in ("espeak-ng", "espeak"):
+        if shutil.which(tool) is None:
+            continue
+        try:
+            subprocess.run([tool, "-s", "140", "-w", path, text], capture_output=True, check=True, timeout=60)
+            return tool
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            continue
+    return None
+
+
+def start_app(stub_url, workdir, speech_engine=None, admission=None):
+    """Import the app against the stub server and serve it on a free port"""
+    from werkzeug.serving import make_server
+
+    os.environ["OLLAMA_ENDPOINTS"] = stub_url
+    # The app creates uploads/ and pdf_output/ relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    # Config is read at import time, so overrides go in before importing the app
+    from config import OLLAMA_CONFIG, SECURITY_CONFIG, SPEECH_CONFIG
+    # Keep-warm pings would show up in the stub's request counts
+    OLLAMA_CONFIG["keep_warm"] = False
+    if speech_engine:
+        SPEECH_CONFIG["file_engine"] = speech_engine
+    SECURITY_CONFIG.update({key: value for key, value in (admission or {}).items() if value is not None})
+
+    import app as app_module
+    app_module.token_usage.log_path = None
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="benchmark-app", daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_request(session, base_url, scenario, index, samples):
+    """Issue one request and return its timing record"""
+    endpoint, _, media = scenario.partition(':')
+    problem = SAMPLE_PROBLEMS[index % len(SAMPLE_PROBLEMS)]
+
+    # Force tracing so every response carries a Server-Timing breakdown
+    headers = {"X-Timing": "1"}
+    started = time.perf_counter()
+    try:
+        if endpoint == "solve_image":
+            with open(samples[media], 'rb') as sample:
+                response = session.post(f"{base_url}/solve_image",
+                                        files={"file": (os.path.basename(samples[media]), sample)},
+                                        headers=headers, timeout=600)
+        else:
+            response = session.post(f"{base_url}/{endpoint}", data={"text": problem}, headers=headers, timeout=600)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        try:
+            success = bool(response.json().get("success"))
+        except ValueError:
+            success = False
+        return {
+            "status": response.status_code,
+            "success": success,
+            "ms": elapsed_ms,
+            "stages": parse_server_timing(response.headers.get("Server-Timing"))
+        }
+    except requests.exceptions.RequestException as e:
+        return {"status": None, "success": False, "ms": (time.perf_counter() - started) * 1000, "stages": {}, "error": str(e)}
+
+
+def run_scenario(base_url, scenario, total, concurrency, samples):
+    """Run `total` requests for one scenario with `concurrency` workers"""
+    local = threading.local()
+
+    def worker(index):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return run_request(local.session, base_url, scenario, index, samples)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(total)))
+    wall_seconds = time.perf_counter() - started
+
+    status_codes = {}
+    for result in results:
+        key = str(result["status"])
+        status_codes[key] = status_codes.get(key, 0) + 1
+
+    stage_values = {}
+    for result in results:
+        for stage, ms in result["stages"].items():
+            stage_values.setdefault(stage, []).append(ms)
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(total / wall_seconds, 3) if wall_seconds else None,
+        "successes": sum(1 for r in results if r["success"]),
+        "status_codes": status_codes,
+        "latency": summarize([r["ms"] for r in results]),
+        "stages": {stage: summarize(values) for stage, values in sorted(stage_values.items())}
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark equalearn.ai. against a stub Ollama server")
+    parser.add_argument("--requests", type=int, default=20, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenarios", default=",".join(ALL_SCENARIOS),
+                        help=f"comma-separated subset of {', '.join(ALL_SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub delay per request (seconds)")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="stub generation speed")
+    parser.add_argument("--eval-tokens", type=int, default=120, help="stub tokens per response")
+    parser.add_argument("--load-sec", type=float, default=0.0, help="stub model load time on first use")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of stub requests failing with HTTP 500")
+    parser.add_argument("--samples-dir", help="directory with sample.png, sample.mp4 and sample.wav to use instead of generated ones")
+    parser.add_argument("--no-admission-control", dest="admission_control", action="store_false", default=None,
+                        help="disable load shedding so the solve_image scenarios measure throughput, not 429s")
+    parser.add_argument("--max-ollama-queue", type=int, help="override SECURITY_CONFIG max_ollama_queue")
+    parser.add_argument("--max-cpu-jobs", type=int, help="override SECURITY_CONFIG max_cpu_jobs")
+    parser.add_argument("--speech-engine", help="speech engine for uploaded audio, e.g. sphinx to stay offline "
+                                                "(default: SPEECH_CONFIG file_engine)")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in ALL_SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    stub = start_stub_server(StubOllamaConfig(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        eval_tokens=args.eval_tokens,
+        load_sec=args.load_sec,
+        failure_rate=args.failure_rate,
+        seed=0
+    ))
+
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix="equalearn-bench-") as workdir:
+        if args.samples_dir:
+            samples_dir = os.path.abspath(args.samples_dir)
+            samples = {kind: os.path.join(samples_dir, name) for kind, name in
+                       (("image", "sample.png"), ("video", "sample.mp4"), ("audio", "sample.wav"))}
+            samples["audio_kind"] = "samples-dir"
+        else:
+            samples = create_sample_media(workdir)
+
+        server, base_url = start_app(stub.url, workdir, args.speech_engine, {
+            "enable_admission_control": args.admission_control,
+            "max_ollama_queue": args.max_ollama_queue,
+            "max_cpu_jobs": args.max_cpu_jobs
+        })
+        from config import SECURITY_CONFIG, SPEECH_CONFIG
+        try:
+            results = {}
+            for scenario in scenarios:
+                print(f"Running {scenario}: {args.requests} requests @ concurrency {args.concurrency}", file=sys.stderr)
+                results[scenario] = run_scenario(base_url, scenario, args.requests, args.concurrency, samples)
+        finally:
+            server.shutdown()
+            stub.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stub": {
+                "latency": args.latency,
+                "tokens_per_sec": args.tokens_per_sec,
+                "eval_tokens": args.eval_tokens,
+                "load_sec": args.load_sec,
+                "failure_rate": args.failure_rate
+            },
+            "admission": {
+                "enabled": SECURITY_CONFIG.get("enable_admission_control", True),
+                "max_ollama_queue": SECURITY_CONFIG.get("max_ollama_queue", 16),
+                "max_cpu_jobs": SECURITY_CONFIG.get("max_cpu_jobs", 4)
+            },
+            "audio_sample": samples["audio_kind"],
+            "speech_engine": SPEECH_CONFIG.get("file_engine")
+        },
+        "scenarios": results,
+        "stub_stats": stub.stats()
+    }
+
+    rendered = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            output_file.write(rendered + '\n')
+        print(f"Results written to {output_path}", file=sys.stderr)
+    else:
+        print(rendered)
+
+    for scenario, result in results.items():
+        latency = result["latency"]
+        print(f"{scenario:<22} {result['throughput_rps']:>8} req/s  p50 {latency.get('p50_ms')} ms  "
+              f"p95 {latency.get('p95_ms')} ms  p99 {latency.get('p99_ms')} ms  "
+              f"ok {result['successes']}/{result['requests']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+equalearn.ai. Stub Ollama server for offline benchmarks
+Implements the parts of the Ollama HTTP API the app uses (/api/generate,
+/api/tags, /api/ps) with configurable latency, generation speed, streaming
+and failure injection, so the app can be load-tested on a CPU-only box.
+
+Run standalone:
+    python benchmarks/stub_ollama.py --port 11434 --tokens-per-sec 40
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SOLVE_RESPONSE = """**Step 1: Understand the problem**
+We are asked to evaluate the expression.
+
+**Step 2: Compute**
+\\begin{align}
+x &= 2 + 2 \\\\
+  &= 4
+\\end{align}
+
+**Final Answer:** $x = 4$"""
+
+PRACTICE_RESPONSE = "**Calculation Problems (10):**\n" + "\n".join(
+    f"{i}. Compute ${i} + {i}$." for i in range(1, 11)
+) + "\n\n**Answers:**\n" + "\n".join(
+    f"{i}. ${i} + {i} = {2 * i}$" for i in range(1, 11)
+)
+
+
+class StubOllamaConfig:
+    """Behaviour knobs for the stub server"""
+
+    def __init__(self, latency=0.05, tokens_per_sec=200.0, eval_tokens=120, prompt_eval_sec=0.02,
+                 load_sec=0.0, failure_rate=0.0, stream_chunk_tokens=8, seed=None):
+        self.latency = latency  # fixed queueing/network delay per request (seconds)
+        self.tokens_per_sec = tokens_per_sec  # simulated generation speed
+        self.eval_tokens = eval_tokens  # tokens "generated" per response, capped by num_predict
+        self.prompt_eval_sec = prompt_eval_sec  # simulated prompt evaluation time
+        self.load_sec = load_sec  # one-off model load time on first use of each model
+        self.failure_rate = failure_rate  # fraction of generate requests answered with HTTP 500
+        self.stream_chunk_tokens = stream_chunk_tokens
+        self.random = random.Random(seed)
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """Threaded HTTP server that keeps per-request statistics"""
+
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, StubOllamaHandler)
+        self.config = config
+        self.loaded_models = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, entry):
+        with self.lock:
+            self.requests.append(entry)
+
+    def stats(self):
+        """Summarize handled generate requests"""
+        with self.lock:
+            entries = list(self.requests)
+        return {
+            "requests": len(entries),
+            "failures": sum(1 for e in entries if e["status"] != 200),
+            "eval_tokens": sum(e["eval_count"] for e in entries),
+            "busy_seconds": round(sum(e["seconds"] for e in entries), 3)
+        }
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            models = sorted(self.server.loaded_models) or ["gemma3:4b"]
+            self._send_json({"models": [{"name": name, "model": name} for name in models]})
+        elif self.path == "/api/ps":
+            expires_at = (datetime.now(timezone.utc) + timedelta(minutes=30)).isoformat()
+            self._send_json({"models": [
+                {"name": name, "model": name, "expires_at": expires_at, "size_vram": 0}
+                for name in sorted(self.server.loaded_models)
+            ]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        started = time.perf_counter()
+
+        model = payload.get("model", "gemma3:4b")
+        prompt = payload.get("prompt", "")
+        options = payload.get("options") or {}
+
+        time.sleep(config.latency)
+
+        if config.failure_rate and config.random.random() < config.failure_rate:
+            self._send_json({"error": "injected failure"}, status=500)
+            self.server.record({"status": 500, "eval_count": 0, "seconds": time.perf_counter() - started})
+            return
+
+        load_sec = 0.0
+        with self.server.lock:
+            if model not in self.server.loaded_models:
+                self.server.loaded_models[model] = datetime.now().isoformat()
+                load_sec = config.load_sec
+        time.sleep(load_sec)
+
+        # An empty prompt only loads the model, like the real server
+        if not prompt:
+            result = self._result(model, "", 0, load_sec, 0.0, 0.0, "load")
+            self._send_json(result)
+            self.server.record({"status": 200, "eval_count": 0, "seconds": time.perf_counter() - started})
+            return
+
+        text = PRACTICE_RESPONSE if "practice worksheet" in prompt else SOLVE_RESPONSE
+        eval_count = min(config.eval_tokens, options.get("num_predict") or config.eval_tokens)
+        done_reason = "length" if eval_count < config.eval_tokens else "stop"
+
+        time.sleep(config.prompt_eval_sec)
+        eval_sec = eval_count / config.tokens_per_sec if config.tokens_per_sec else 0.0
+
+        if payload.get("stream", True):
+            self._stream(model, text, eval_count, eval_sec, load_sec, config, done_reason)
+        else:
+            time.sleep(eval_sec)
+            self._send_json(self._result(model, text, eval_count, load_sec, config.prompt_eval_sec, eval_sec, done_reason))
+
+        self.server.record({"status": 200, "eval_count": eval_count, "seconds": time.perf_counter() - started})
+
+    def _stream(self, model, text, eval_count, eval_sec, load_sec, config, done_reason):
+        """Send NDJSON chunks paced at the configured tokens/sec"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunks = max(1, eval_count // max(1, config.stream_chunk_tokens))
+        piece = max(1, len(text) // chunks)
+        for i in range(chunks):
+            time.sleep(eval_sec / chunks)
+            fragment = text[i * piece:] if i == chunks - 1 else text[i * piece:(i + 1) * piece]
+            self._write_chunk({"model": model, "response": fragment, "done": False})
+
+        self._write_chunk(self._result(model, "", eval_count, load_sec, config.prompt_eval_sec, eval_sec, done_reason))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _result(model, text, eval_count, load_sec, prompt_eval_sec, eval_sec, done_reason):
+        # Durations are reported in nanoseconds, as Ollama does
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": True,
+            "done_reason": done_reason,
+            "load_duration": int(load_sec * 1e9),
+            "prompt_eval_count": 64,
+            "prompt_eval_duration": int(prompt_eval_sec * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_sec * 1e9),
+            "total_duration": int((load_sec + prompt_eval_sec + eval_sec) * 1e9)
+        }
+
+
+def start_stub_server(config=None, host="127.0.0.1", port=0):
+    """Start a stub server on a background thread and return it"""
+    server = StubOllamaServer((host, port), config or StubOllamaConfig())
+    thread = threading.Thread(target=server.serve_forever, name="stub-ollama", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="fixed delay per request (seconds)")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="simulated generation speed")
+    parser.add_argument("--eval-tokens", type=int, default=120, help="tokens generated per response")
+    parser.add_argument("--load-sec", type=float, default=0.0, help="model load time on first use")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    args = parser.parse_args()
+
+    config = StubOllamaConfig(
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        eval_tokens=args.eval_tokens,
+        load_sec=args.load_sec,
+        failure_rate=args.failure_rate
+    )
+    server = StubOllamaServer((args.host, args.port), config)
+    print(f"Stub Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,29 @@ OLLAMA_CONFIG = {
     "timeout": 120,  # 秒
     "temperature": 0.1,  # 解题时的温度
     "practice_temperature": 0.3,  # 生成练习题时的温度
-    "max_tokens": 2048
+    "max_tokens": 2048,
+    "keep_alive": "30m",  # 模型在显存中保留的时间（Ollama keep_alive 格式）
+    "keep_warm": True,  # 后台保活线程（开发服务器与 WSGI worker 均在首个请求时启动）
+    "preload_on_startup": True,  # 保活线程启动时先预加载模型
+    "keep_warm_interval": 240,  # 保活心跳间隔（秒）
+    "keep_warm_hours": (7, 22),  # 保活时段（本地时间，起止小时），None 表示全天
+    # 多个 Ollama 实例（可用环境变量 OLLAMA_ENDPOINTS 以逗号分隔覆盖）
+    "endpoints": [
+        url.strip()
+        for url in os.environ.get("OLLAMA_ENDPOINTS", "http://localhost:11434").split(",")
+        if url.strip()
+    ],
+    # 按模式覆盖模型；未列出的模式使用上面的 "model"
+    # 例如练习题生成改用更小的模型：{"practice": "gemma3:1b"}
+    "mode_models": {},
+    "max_failures": 3,  # 连续失败多少次后暂时剔除该实例
+    "eject_seconds": 30,  # 剔除时长（秒）
+    # 按模式和题目复杂度设置 num_predict 上限
+    "token_budgets": {
+        "solve": {"simple": 512, "moderate": 1024, "complex": 2048},
+        "practice": {"simple": 2048, "moderate": 2048, "complex": 2048}  # 练习题篇幅与原题难度无关，待 /token_usage 数据再调
+    },
+    "token_usage_log": "token_usage.jsonl"  # 每次请求的 eval_count 记录，None 表示只保存在内存
 }
 
 # 文件上传配置
@@ -39,7 +61,23 @@ SPEECH_CONFIG = {
         "en": "en-US",
         "zh": "zh-CN"
     },
-    "timeout": 10  # 语音识别超时时间（秒）
+    "timeout": 10,  # 语音识别超时时间（秒）
+    # 上传音频文件（/solve_image）使用的识别引擎；google 需联网，sphinx 等可离线
+    "file_engine": "google",
+    "file_engine_options": {},
+    # 流式语音输入（/stream_audio）
+    "stream_engine": "sphinx",  # 本地识别引擎：sphinx（默认，需 pocketsphinx）、vosk、whisper、faster_whisper
+    "stream_language": "en-US",  # 识别语言；whisper 系列自动转为 "en"，vosk 由模型决定语言而忽略此项
+    "stream_engine_options": {},  # 额外传给识别引擎的参数，例如 whisper 的 {"model": "small"}
+    "stream_sample_rate": 16000,  # 客户端上传的 16 位单声道 PCM 采样率
+    "vad_energy_threshold": 300,  # 语音活动检测的能量阈值
+    "vad_silence_ms": 600,  # 静音多久视为一句话结束（毫秒）
+    "vad_min_speech_ms": 250,  # 短于此时长的声音忽略（毫秒）
+    "vad_max_segment_seconds": 10,  # 单句最长时长（秒）
+    "stream_max_seconds": 120,  # 单次录音最长时长（秒）
+    "stream_idle_timeout": 60,  # 会话空闲多久后丢弃（秒）
+    "stream_max_sessions": 20,  # 同时进行的录音会话上限
+    "stream_workers": 2  # 识别线程数
 }
 
 # 应用配置
@@ -81,7 +119,9 @@ UI_CONFIG = {
     "default_language": "en",  # Default language
     "supported_languages": ["en"],
     "theme": "dark",  # Theme: dark or light
-    "auto_translate": True  # Whether to auto-translate
+    "auto_translate": True,  # Whether to auto-translate
+    "server_side_math": True,  # Pre-render solution math to MathML on the server (needs latex2mathml)
+    "katex_local_dir": "static/katex"  # Local KaTeX assets (see fetch_katex.sh); CDN is used when missing
 }
 
 # Logging configuration
@@ -95,5 +135,23 @@ LOGGING_CONFIG = {
 SECURITY_CONFIG = {
     "max_requests_per_minute": 60,
     "enable_rate_limiting": False,
-    "allowed_hosts": ["localhost", "127.0.0.1"]
-} 
\ No newline at end of file
+    "allowed_hosts": ["localhost", "127.0.0.1"],
+    "burst_requests": 20,  # Short bursts allowed on cheap endpoints
+    "max_expensive_requests_per_minute": 6,  # /solve_text, /generate_practice, /solve_image
+    "expensive_burst_requests": 3,
+    "rate_limit_store": "memory",  # "memory" (per process) or "sqlite" (shared by all workers)
+    "rate_limit_db": "rate_limits.db",
+    "trust_forwarded_for": False,  # Use the last X-Forwarded-For hop as the client id (behind one reverse proxy)
+    "enable_admission_control": True,
+    "max_ollama_queue": 16,  # Concurrent Ollama-bound requests before shedding with 429
+    "max_cpu_jobs": 4,  # Concurrent OCR / audio jobs before shedding with 429
+    "shed_retry_after": 5  # Retry-After (seconds) sent when shedding load
+}
+
+# Request tracing configuration
+TRACING_CONFIG = {
+    "enabled": True,
+    "sample_rate": 1.0,  # Fraction of requests traced; lower it in production
+    "export_path": None,  # e.g. "traces.jsonl" to append sampled traces as OTLP JSON
+    "service_name": "equalearn.ai"
+}
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Download KaTeX into static/katex so math rendering works offline
+# and the browser does not fetch it from a CDN on every page load.
+
+KATEX_VERSION="0.16.9"
+KATEX_DIR="$(cd "$(dirname "$0")" && pwd)/static/katex"
+
+if [ -f "$KATEX_DIR/katex.min.js" ]; then
+    echo "✅ KaTeX already available in static/katex"
+    exit 0
+fi
+
+echo "📐 Downloading KaTeX $KATEX_VERSION..."
+TMP_DIR=$(mktemp -d)
+trap 'rm -rf "$TMP_DIR"' EXIT
+
+if curl -fsSL "https://registry.npmjs.org/katex/-/katex-$KATEX_VERSION.tgz" -o "$TMP_DIR/katex.tgz"; then
+    tar -xzf "$TMP_DIR/katex.tgz" -C "$TMP_DIR"
+    mkdir -p "$KATEX_DIR"
+    cp -R "$TMP_DIR/package/dist/." "$KATEX_DIR/"
+    echo "✅ KaTeX installed to static/katex"
+else
+    echo "⚠️  Could not download KaTeX, the app will load it from the CDN instead"
+fi
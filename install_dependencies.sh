@@ -38,12 +38,16 @@ fi
 echo "🐍 Installing Python dependencies..."
 pip3 install -r requirements.txt
 
+# Download KaTeX for offline math rendering
+./fetch_katex.sh
+
 echo ""
 echo "🎉 Installation complete!"
 echo "=============================================="
 echo "✅ Tesseract OCR - for image and video text extraction"
 echo "✅ FFmpeg - for audio and video processing"
 echo "✅ Python packages - for the application"
+echo "✅ KaTeX - for offline math rendering"
 echo ""
 echo "🚀 You can now start the application with:"
 echo "   python3 app.py"
@@ -0,0 +1,67 @@
+"""
+equalearn.ai. Server-side math rendering
+Converts the LaTeX math in a solution to MathML once on the server so weak
+devices can display it natively instead of running KaTeX on every view.
+Requires the optional latex2mathml package; without it rendering is
+skipped and the browser falls back to KaTeX.
+"""
+
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+try:
+    from latex2mathml.converter import convert as latex_to_mathml
+    LATEX2MATHML_AVAILABLE = True
+except ImportError:
+    latex_to_mathml = None
+    LATEX2MATHML_AVAILABLE = False
+
+# Same delimiters static/app.js hands to KaTeX auto-render, longest first
+MATH_PATTERN = re.compile(
+    r'(?P<display>\$\$(?P<dd>.+?)\$\$'
+    r'|\\\[(?P<bracket>.+?)\\\]'
+    r'|(?P<env>\\begin\{(?:align|equation)\*?\}.+?\\end\{(?:align|equation)\*?\}))'
+    r'|(?P<inline>\\\((?P<paren>.+?)\\\)'
+    r'|\$(?P<dollar>[^\$\n]+?)\$)',
+    re.DOTALL
+)
+
+
+def _convert(source, display):
+    # The xmlns attribute is redundant inside HTML and its URL dots would
+    # trip the client's sentence-based final-answer parsing
+    mathml = latex_to_mathml(source, display="block" if display else "inline")
+    return mathml.replace(' xmlns="http://www.w3.org/1998/Math/MathML"', '')
+
+
+@lru_cache(maxsize=512)
+def render_math_segments(text):
+    """
+    Render every math segment in `text` to MathML.
+    Returns a dict mapping each segment, delimiters included, to its MathML.
+    Segments that fail to convert are left out so the client can render them.
+    """
+    if not LATEX2MATHML_AVAILABLE or not text:
+        return {}
+
+    rendered = {}
+    for match in MATH_PATTERN.finditer(text):
+        segment = match.group(0)
+        if segment in rendered:
+            continue
+
+        if match.group('env'):
+            source, display = segment, True
+        elif match.group('display'):
+            source, display = match.group('dd') or match.group('bracket'), True
+        else:
+            source, display = match.group('paren') or match.group('dollar'), False
+
+        try:
+            rendered[segment] = _convert(source.strip(), display)
+        except Exception as e:
+            logger.debug(f"Could not pre-render math segment {segment[:40]!r}: {e}")
+    return rendered
@@ -0,0 +1,194 @@
+"""
+equalearn.ai. Ollama model lifecycle management
+Keeps the configured model resident in memory so the first solve after idle
+does not pay the full model-load cost.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_running_models(api_url, timeout=5):
+    """
+    Return the models resident on an Ollama endpoint (GET /api/ps).
+    Raises RequestException when unreachable and ValueError on a bad response.
+    """
+    response = requests.get(f"{api_url}/api/ps", timeout=timeout)
+    if response.status_code != 200:
+        raise ValueError(f"Ollama API error: {response.status_code}")
+    payload = response.json()
+    if not isinstance(payload, dict):
+        raise ValueError("Unexpected /api/ps response")
+    return payload.get("models", [])
+
+
+class ModelLifecycleManager:
+    """Preload the Ollama model, keep it warm and report its load state"""
+
+    def __init__(self, api_url, model, keep_alive="30m", ping_interval=240, active_hours=None):
+        self.api_url = api_url
+        self.model = model
+        self.keep_alive = keep_alive
+        self.ping_interval = ping_interval
+        self.active_hours = active_hours
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.loaded = False
+        self.last_load_seconds = None
+        self.last_load_duration = None
+        self.last_loaded_at = None
+        self.last_ping_at = None
+        self.last_error = None
+
+    def is_active_hour(self, now=None):
+        """Check whether the current local time falls inside the keep-warm window"""
+        if not self.active_hours:
+            return True
+        start_hour, end_hour = self.active_hours
+        hour = (now or datetime.now()).hour
+        if start_hour <= end_hour:
+            return start_hour <= hour < end_hour
+        # Window wraps past midnight, e.g. (22, 6)
+        return hour >= start_hour or hour < end_hour
+
+    def preload(self):
+        """
+        Load the model into memory by sending an empty prompt.
+        Ollama loads the model and returns immediately without generating.
+        """
+        started = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{self.api_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": self.keep_alive
+                },
+                timeout=300
+            )
+            elapsed = time.perf_counter() - started
+
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama API error: {response.status_code}")
+
+            result = response.json()
+            with self._lock:
+                self.loaded = True
+                self.last_load_seconds = round(elapsed, 3)
+                # Ollama reports load_duration in nanoseconds
+                load_duration = result.get("load_duration")
+                self.last_load_duration = round(load_duration / 1e9, 3) if load_duration else None
+                self.last_loaded_at = datetime.now().isoformat(timespec="seconds")
+                self.last_ping_at = self.last_loaded_at
+                self.last_error = None
+
+            logger.info(f"Model {self.model} ready in {elapsed:.2f}s")
+            return True
+
+        except Exception as e:
+            with self._lock:
+                self.loaded = False
+                self.last_error = str(e)
+            logger.warning(f"Failed to preload model {self.model}: {e}")
+            return False
+
+    def find_resident(self, running):
+        """Pick this manager's model out of an /api/ps model list"""
+        return next((m for m in running if m.get("name") == self.model or m.get("model") == self.model), None)
+
+    def refresh_load_state(self):
+        """Ask Ollama which models are currently resident"""
+        try:
+            running = fetch_running_models(self.api_url)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                self.loaded = False
+                self.last_error = str(e)
+            return None
+
+        resident = self.find_resident(running)
+        with self._lock:
+            self.loaded = resident is not None
+        return resident
+
+    def start(self, preload=True):
+        """Start the background keep-warm thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(preload,), name="ollama-keep-warm", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background keep-warm thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self, preload):
+        if preload:
+            self.preload()
+
+        while not self._stop_event.wait(self.ping_interval):
+            if self.is_active_hour():
+                self.ping()
+
+    def ping(self):
+        """Refresh keep_alive on a resident model, or reload it if it was evicted"""
+        if self.refresh_load_state() is None:
+            return self.preload()
+
+        try:
+            # A load request on a resident model just resets its keep_alive timer
+            response = requests.post(
+                f"{self.api_url}/api/generate",
+                json={"model": self.model, "prompt": "", "stream": False, "keep_alive": self.keep_alive},
+                timeout=30
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama API error: {response.status_code}")
+            with self._lock:
+                self.last_ping_at = datetime.now().isoformat(timespec="seconds")
+                self.last_error = None
+            return True
+
+        except Exception as e:
+            with self._lock:
+                self.last_error = str(e)
+            logger.warning(f"Keep-warm ping for {self.model} failed: {e}")
+            return False
+
+    def status(self, running=None):
+        """
+        Return the current model load state.
+        `running` is the endpoint's /api/ps model list, fetched once by the
+        caller and shared by every manager on that endpoint; None means unknown.
+        """
+        resident = self.find_resident(running) if running is not None else None
+        with self._lock:
+            return {
+                "model": self.model,
+                "api_url": self.api_url,
+                "loaded": resident is not None if running is not None else self.loaded,
+                "keep_alive": self.keep_alive,
+                "keep_warm_active": self.is_active_hour(),
+                "keep_warm_running": bool(self._thread and self._thread.is_alive()),
+                "last_load_seconds": self.last_load_seconds,
+                "last_load_duration": self.last_load_duration,
+                "last_loaded_at": self.last_loaded_at,
+                "last_ping_at": self.last_ping_at,
+                "expires_at": resident.get("expires_at") if resident else None,
+                "size_vram": resident.get("size_vram") if resident else None,
+                "last_error": self.last_error
+            }
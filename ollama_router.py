@@ -0,0 +1,181 @@
+"""
+equalearn.ai. Ollama backend router
+Spreads generate requests across several Ollama instances, preferring the
+least-loaded healthy endpoint and temporarily ejecting endpoints that fail.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaBackend:
+    """Load and health state for a single Ollama endpoint"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.last_error = None
+
+    def is_available(self, now):
+        return self.ejected_until <= now
+
+    def to_dict(self, now):
+        return {
+            "url": self.url,
+            "healthy": self.is_available(now),
+            "in_flight": self.in_flight,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error
+        }
+
+
+class OllamaRouter:
+    """Dispatch requests to the least-loaded healthy Ollama endpoint"""
+
+    MODES = ("solve", "practice")
+
+    def __init__(self, endpoints, mode_models, default_model, max_failures=3, eject_seconds=30, latency_alpha=0.3):
+        if not endpoints:
+            raise ValueError("At least one Ollama endpoint is required")
+
+        self.backends = [OllamaBackend(url) for url in endpoints]
+        self.mode_models = dict(mode_models or {})
+        self.default_model = default_model
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.latency_alpha = latency_alpha
+        self._lock = threading.Lock()
+
+    def model_for(self, mode):
+        """Return the model configured for a request mode (solve/practice)"""
+        return self.mode_models.get(mode, self.default_model)
+
+    def models(self):
+        """Return every distinct model the router may dispatch to"""
+        return list(dict.fromkeys(self.model_for(mode) for mode in self.MODES))
+
+    def acquire(self, exclude=()):
+        """
+        Pick the least-loaded healthy endpoint and reserve a slot on it.
+        Falls back to the endpoint whose ejection expires first when every
+        endpoint is ejected, so a fully-failed pool still gets probed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+
+            healthy = [b for b in candidates if b.is_available(now)]
+            if healthy:
+                backend = min(healthy, key=lambda b: (b.in_flight, b.latency_ewma or 0.0))
+            else:
+                backend = min(candidates, key=lambda b: b.ejected_until)
+
+            backend.in_flight += 1
+            backend.total_requests += 1
+            return backend
+
+    def release(self, backend, elapsed=None, error=None):
+        """Release a slot and record the outcome of the request"""
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.ejected_until = 0.0
+                if elapsed is not None:
+                    if backend.latency_ewma is None:
+                        backend.latency_ewma = elapsed
+                    else:
+                        backend.latency_ewma += self.latency_alpha * (elapsed - backend.latency_ewma)
+                return
+
+            backend.consecutive_failures += 1
+            backend.total_failures += 1
+            backend.last_error = str(error)
+            if backend.consecutive_failures >= self.max_failures:
+                backend.ejected_until = time.monotonic() + self.eject_seconds
+                logger.warning(f"Ejecting Ollama endpoint {backend.url} for {self.eject_seconds}s: {error}")
+
+    @staticmethod
+    def is_backend_failure(status_code):
+        """True for answers that mean this endpoint cannot serve the request"""
+        # Ollama answers 404 when the model has not been pulled on that instance
+        return status_code == 404 or status_code >= 500
+
+    def post(self, path, payload, timeout):
+        """
+        POST to the best available endpoint, moving on to the next one when
+        an endpoint cannot be reached, does not have the model or returns a
+        server error. Read timeouts are not retried.
+        Returns the response of the last attempt; re-raises the last
+        request error when no endpoint answered at all.
+        """
+        tried = []
+        last_exception = None
+        last_response = None
+
+        while True:
+            backend = self.acquire(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+
+            started = time.perf_counter()
+            try:
+                response = requests.post(f"{backend.url}{path}", json=payload, timeout=timeout)
+            except requests.exceptions.ConnectionError as e:
+                self.release(backend, error=e)
+                last_exception = e
+                continue
+            except requests.exceptions.Timeout as e:
+                # The endpoint accepted the request but is too slow; retrying
+                # elsewhere would only double the wait for the student
+                self.release(backend, error=e)
+                raise
+            except requests.exceptions.RequestException as e:
+                # Broken responses (chunked encoding, decoding) are the endpoint's fault
+                self.release(backend, error=e)
+                last_exception = e
+                continue
+            except Exception as e:
+                self.release(backend, error=e)
+                raise
+
+            elapsed = time.perf_counter() - started
+            if self.is_backend_failure(response.status_code):
+                self.release(backend, error=f"HTTP {response.status_code}")
+                last_response = response
+                continue
+
+            # Only successful answers say anything about the endpoint's speed
+            self.release(backend, elapsed=elapsed if response.ok else None)
+            return response
+
+        if last_response is not None:
+            return last_response
+        raise last_exception
+
+    def status(self):
+        """Return per-endpoint load and health information"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "mode_models": {mode: self.model_for(mode) for mode in self.MODES},
+                "endpoints": [backend.to_dict(now) for backend in self.backends]
+            }
@@ -0,0 +1,161 @@
+"""
+equalearn.ai. Rate limiting and admission control
+Per-client token buckets (in memory, or in SQLite so limits hold across
+worker processes) and a concurrency gate that sheds load when the Ollama
+queue or the media-processing pool is saturated.
+"""
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _refill(tokens, updated, now, capacity, rate):
+    """Return the bucket level after refilling for the time since `updated`"""
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+def _take(tokens, cost, rate):
+    """Try to take `cost` tokens; return (allowed, new_tokens, retry_after_seconds)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate if rate else float('inf')
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process only"""
+
+    def __init__(self, purge_every=1000, idle_seconds=3600):
+        self.purge_every = purge_every
+        self.idle_seconds = idle_seconds
+        self._buckets = {}
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1.0):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            allowed, tokens, retry_after = _take(tokens, cost, rate)
+            self._buckets[key] = (tokens, now)
+
+            # Drop clients that have gone quiet so the dict does not grow forever
+            self._calls += 1
+            if self._calls % self.purge_every == 0:
+                cutoff = now - self.idle_seconds
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] >= cutoff}
+            return allowed, retry_after
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path, purge_every=1000, idle_seconds=3600):
+        self.path = path
+        self.purge_every = purge_every
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._calls = 0
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, cost=1.0):
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # workers cannot both read the same bucket level
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = _refill(tokens, updated, now, capacity, rate)
+            allowed, tokens, retry_after = _take(tokens, cost, rate)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now)
+            )
+
+            self._calls += 1
+            if self._calls % self.purge_every == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_seconds,))
+
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after
+
+
+class RateLimiter:
+    """Per-client token-bucket limits with separate budgets per endpoint class"""
+
+    def __init__(self, store, budgets):
+        # budgets: {"cheap": (per_minute, burst), "expensive": (per_minute, burst)}
+        self.store = store
+        self.budgets = budgets
+
+    def check(self, client_id, endpoint_class):
+        """Return (allowed, retry_after_seconds) for one request"""
+        per_minute, burst = self.budgets[endpoint_class]
+        try:
+            return self.store.take(f"{endpoint_class}:{client_id}", burst, per_minute / 60.0)
+        except sqlite3.Error as e:
+            # Fail open: a broken limiter store should not take the site down
+            logger.error(f"Rate limiter store error: {e}")
+            return True, 0.0
+
+
+class AdmissionController:
+    """Cap concurrent work per pool and shed anything beyond the cap"""
+
+    def __init__(self, limits):
+        # limits: {"ollama": max_in_flight, "cpu": max_in_flight}
+        self.limits = dict(limits)
+        self.in_flight = {pool: 0 for pool in self.limits}
+        self.rejected = {pool: 0 for pool in self.limits}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, pool):
+        with self._lock:
+            if self.in_flight[pool] >= self.limits[pool]:
+                self.rejected[pool] += 1
+                return False
+            self.in_flight[pool] += 1
+            return True
+
+    def release(self, pool):
+        with self._lock:
+            self.in_flight[pool] = max(0, self.in_flight[pool] - 1)
+
+    def status(self):
+        with self._lock:
+            return {
+                pool: {"in_flight": self.in_flight[pool], "limit": self.limits[pool], "rejected": self.rejected[pool]}
+                for pool in self.limits
+            }
+
+
+MAX_RETRY_AFTER = 3600
+
+
+def retry_after_header(seconds):
+    """Format a Retry-After value in whole seconds, between 1 and an hour"""
+    # A zero refill rate yields an infinite wait, which math.ceil cannot handle
+    return str(max(1, math.ceil(min(seconds, MAX_RETRY_AFTER))))
@@ -70,6 +70,10 @@ else
     pip install -r requirements.txt
 fi
 
+# Serve KaTeX locally when possible
+echo "📋 Checking KaTeX assets..."
+./fetch_katex.sh
+
 # Create upload directory
 mkdir -p uploads
 
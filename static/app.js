@@ -80,6 +80,13 @@ function resetResults() {
     solutionSource.style.display = "none";
 }
 
+function showTruncationNotice() {
+    // The model hit its token budget, so the last steps may be missing
+    sourceMessage.textContent = "This solution was cut off by the length limit and may be incomplete. Try solving again or splitting the problem into parts.";
+    solutionSource.style.display = "block";
+    document.getElementById("sourceInfo").className = "alert alert-warning mb-2";
+}
+
 function setButtonLoading(button, isLoading) {
     if (isLoading) {
         button.disabled = true;
@@ -96,6 +103,10 @@ function setButtonLoading(button, isLoading) {
 }
 
 function renderMath(element) {
+    // KaTeX is loaded deferred and is only needed for math the server did not pre-render
+    if (typeof renderMathInElement === 'undefined') {
+        return;
+    }
     try {
         renderMathInElement(element, {
             delimiters: [
@@ -133,8 +144,20 @@ function cleanMarkdown(text) {
         .trim();
 }
 
+// Swap math segments for the MathML the server pre-rendered
+function applyRenderedMath(text, renderedMath) {
+    if (!renderedMath) return text;
+    
+    // Longest segments first so "$$x$$" is not clobbered by "$x$"
+    const segments = Object.keys(renderedMath).sort((a, b) => b.length - a.length);
+    for (const segment of segments) {
+        text = text.split(segment).join(renderedMath[segment]);
+    }
+    return text;
+}
+
 // Parse AI response and display in structured format
-function parseAndDisplaySolution(latexContent) {
+function parseAndDisplaySolution(latexContent, renderedMath) {
     const finalAnswerElement = document.getElementById('finalAnswer');
     const explanationElement = document.getElementById('explanation');
     
@@ -181,12 +204,12 @@ function parseAndDisplaySolution(latexContent) {
     
     // Clean up markdown formatting and display final answer
     const cleanFinalAnswer = cleanMarkdown(finalAnswer);
-    finalAnswerElement.innerHTML = cleanFinalAnswer;
+    finalAnswerElement.innerHTML = applyRenderedMath(cleanFinalAnswer, renderedMath);
     renderMath(finalAnswerElement);
     
     // Parse explanation into structured steps
     const structuredExplanation = parseExplanationIntoSteps(explanation);
-    explanationElement.innerHTML = structuredExplanation;
+    explanationElement.innerHTML = applyRenderedMath(structuredExplanation, renderedMath);
     renderMath(explanationElement);
 }
 
@@ -315,8 +338,12 @@ textForm.addEventListener("submit", async (e) => {
                 sourceInfoElement.className = "alert alert-success mb-2";
             }
             
+            if (data.truncated) {
+                showTruncationNotice();
+            }
+            
             // Parse and display solution in structured format
-            parseAndDisplaySolution(data.latex);
+            parseAndDisplaySolution(data.latex, data.rendered_math);
             latexSolution.style.display = "block";
             
             showState(successState);
@@ -568,8 +595,12 @@ solveExtractedBtn.addEventListener("click", async () => {
                 sourceInfoElement2.className = "alert alert-success mb-2";
             }
             
+            if (data.truncated) {
+                showTruncationNotice();
+            }
+            
             // Parse and display solution in structured format
-            parseAndDisplaySolution(data.latex);
+            parseAndDisplaySolution(data.latex, data.rendered_math);
             latexSolution.style.display = "block";
             
             showState(successState);
@@ -805,23 +836,185 @@ function initSpeechRecognition() {
             voiceInputBtn.classList.add('btn-outline-secondary');
             feather.replace();
         };
-    } else {
+    } else if (!canStreamVoiceInput()) {
         voiceInputBtn.style.display = 'none';
         console.warn('Speech recognition not supported');
     }
 }
 
+// Streaming voice input - audio is transcribed locally by the server while the student speaks.
+// Used when the browser has no speech recognition of its own or is offline.
+let voiceStream = null;
+
+function canStreamVoiceInput() {
+    return !!(navigator.mediaDevices && navigator.mediaDevices.getUserMedia &&
+              (window.AudioContext || window.webkitAudioContext));
+}
+
+function setVoiceButtonRecording(recording) {
+    isRecording = recording;
+    voiceInputBtn.innerHTML = recording ? '<i data-feather="square"></i>' : '<i data-feather="mic"></i>';
+    voiceInputBtn.classList.toggle('btn-danger', recording);
+    voiceInputBtn.classList.toggle('btn-outline-secondary', !recording);
+    feather.replace();
+}
+
+// Convert Float32 samples at the device rate to 16-bit PCM at the server rate
+function downsampleToPcm16(samples, inputRate, outputRate) {
+    const ratio = inputRate / outputRate;
+    const length = Math.floor(samples.length / ratio);
+    const pcm = new Int16Array(length);
+    for (let i = 0; i < length; i++) {
+        const sample = Math.max(-1, Math.min(1, samples[Math.floor(i * ratio)]));
+        pcm[i] = sample < 0 ? sample * 0x8000 : sample * 0x7FFF;
+    }
+    return pcm;
+}
+
+function releaseVoiceStream(stream) {
+    stream.processor.disconnect();
+    stream.source.disconnect();
+    stream.media.getTracks().forEach(track => track.stop());
+    stream.context.close();
+}
+
+function failVoiceStream(stream, error) {
+    // Report only the first failure; later chunks are not sent
+    if (stream.failed) return;
+    stream.failed = true;
+    if (voiceStream === stream) {
+        voiceStream = null;
+        setVoiceButtonRecording(false);
+        releaseVoiceStream(stream);
+    }
+    console.error('Streaming voice input error:', error);
+    showError(error.message || 'Voice input failed');
+}
+
+function sendVoiceChunk(stream, pcm) {
+    if (stream.failed) return;
+    // Chain requests so chunks reach the server in order
+    stream.sending = stream.sending.then(async () => {
+        if (stream.failed) return;
+        const response = await fetch(`/stream_audio/${stream.sessionId}/chunk`, {
+            method: "POST",
+            headers: {"Content-Type": "application/octet-stream"},
+            body: pcm
+        });
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || "Voice input failed");
+        }
+        if (data.partial_text) {
+            document.getElementById('mathInput').value = data.partial_text;
+        }
+    }).catch(error => failVoiceStream(stream, error));
+}
+
+function flushVoiceBuffer(stream) {
+    if (!stream.bufferedSamples) return;
+    const pcm = new Int16Array(stream.bufferedSamples);
+    let offset = 0;
+    for (const part of stream.buffer) {
+        pcm.set(part, offset);
+        offset += part.length;
+    }
+    stream.buffer = [];
+    stream.bufferedSamples = 0;
+    sendVoiceChunk(stream, pcm);
+}
+
+async function startVoiceStream() {
+    const response = await fetch("/stream_audio/start", {method: "POST"});
+    const session = await response.json();
+    if (!response.ok || !session.success) {
+        throw new Error(session.error || "Could not start voice input");
+    }
+    
+    const media = await navigator.mediaDevices.getUserMedia({audio: true});
+    const context = new (window.AudioContext || window.webkitAudioContext)();
+    const source = context.createMediaStreamSource(media);
+    const processor = context.createScriptProcessor(4096, 1, 1);
+    
+    const stream = {
+        sessionId: session.session_id,
+        sampleRate: session.sample_rate,
+        media, context, source, processor,
+        buffer: [],
+        bufferedSamples: 0,
+        sending: Promise.resolve(),
+        failed: false
+    };
+    
+    processor.onaudioprocess = (event) => {
+        const pcm = downsampleToPcm16(event.inputBuffer.getChannelData(0), context.sampleRate, stream.sampleRate);
+        stream.buffer.push(pcm);
+        stream.bufferedSamples += pcm.length;
+        // Send roughly every half second
+        if (stream.bufferedSamples >= stream.sampleRate / 2) {
+            flushVoiceBuffer(stream);
+        }
+    };
+    
+    source.connect(processor);
+    processor.connect(context.destination);
+    voiceStream = stream;
+    setVoiceButtonRecording(true);
+}
+
+async function stopVoiceStream() {
+    const stream = voiceStream;
+    voiceStream = null;
+    setVoiceButtonRecording(false);
+    
+    releaseVoiceStream(stream);
+    flushVoiceBuffer(stream);
+    
+    try {
+        await stream.sending;
+        // A failed chunk has already been reported
+        if (stream.failed) return;
+        const response = await fetch(`/stream_audio/${stream.sessionId}/finish`, {method: "POST"});
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || "Voice input failed");
+        }
+        if (data.text) {
+            document.getElementById('mathInput').value = data.text;
+        }
+    } catch (error) {
+        console.error('Streaming voice input error:', error);
+        showError(error.message || 'Voice input failed');
+    }
+}
+
 // Voice input button event listener
-voiceInputBtn.addEventListener('click', () => {
-    if (!recognition) {
+voiceInputBtn.addEventListener('click', async () => {
+    if (voiceStream) {
+        await stopVoiceStream();
+        return;
+    }
+    
+    if (recognition && navigator.onLine) {
+        if (isRecording) {
+            recognition.stop();
+        } else {
+            recognition.start();
+        }
+        return;
+    }
+    
+    if (!canStreamVoiceInput()) {
         alert('Speech recognition not supported in this browser');
         return;
     }
     
-    if (isRecording) {
-        recognition.stop();
-    } else {
-        recognition.start();
+    try {
+        await startVoiceStream();
+    } catch (error) {
+        console.error('Streaming voice input error:', error);
+        setVoiceButtonRecording(false);
+        showError(error.message || 'Could not start voice input');
     }
 });
 
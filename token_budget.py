@@ -0,0 +1,134 @@
+"""
+equalearn.ai. Token budgets for Ollama generations
+Sizes num_predict by request mode and problem complexity, and records how
+many tokens each generation actually used so the budgets can be tuned.
+"""
+
+import json
+import logging
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Sentinels the prompts ask the model to emit once it is done; they are
+# passed to Ollama as stop sequences so generation ends right there
+SOLVE_STOP_MARKER = "END_OF_SOLUTION"
+PRACTICE_STOP_MARKER = "END_OF_WORKSHEET"
+
+STOP_SEQUENCES = {
+    "solve": [SOLVE_STOP_MARKER],
+    "practice": [PRACTICE_STOP_MARKER]
+}
+
+COMPLEX_KEYWORDS = (
+    'integra', '\\int', '∫', 'derivative', 'differentiat', 'd/dx', 'limit', 'lim ',
+    'prove', 'proof', 'matrix', 'matrices', 'eigen', 'differential', 'series',
+    '\\sum', '∑', 'probability', 'theorem', 'maximize', 'minimize', 'optimi'
+)
+
+MODERATE_KEYWORDS = (
+    'solve', 'equation', 'inequality', 'system', 'factor', 'quadratic', 'polynomial',
+    'sqrt', '\\frac', '√', '^', 'percent', '%', 'area',
+    'volume', 'perimeter', 'ratio'
+)
+
+ARITHMETIC_PATTERN = re.compile(r'^[\d\s+\-*/×÷().,=?]+$')
+VARIABLE_PATTERN = re.compile(r'(?<![a-z])[xyz](?![a-z])')
+FUNCTION_PATTERN = re.compile(r'\b(sin|cos|tan|log|ln)\b')
+
+
+def estimate_complexity(text):
+    """Classify a problem as simple, moderate or complex from its wording"""
+    lowered = text.lower()
+
+    if len(text) > 400 or any(keyword in lowered for keyword in COMPLEX_KEYWORDS):
+        return "complex"
+    if ARITHMETIC_PATTERN.match(text):
+        return "simple"
+    if len(text) > 150 or VARIABLE_PATTERN.search(lowered) or FUNCTION_PATTERN.search(lowered):
+        return "moderate"
+    if any(keyword in lowered for keyword in MODERATE_KEYWORDS):
+        return "moderate"
+    return "simple"
+
+
+def get_token_budget(budgets, mode, complexity, default=2048):
+    """Look up num_predict for a mode/complexity pair, falling back to default"""
+    return budgets.get(mode, {}).get(complexity, default)
+
+
+def strip_stop_marker(text, mode):
+    """Drop a stop marker the model emitted, in case the server did not cut it"""
+    for marker in STOP_SEQUENCES.get(mode, []):
+        index = text.find(marker)
+        if index != -1:
+            text = text[:index]
+    return text.strip()
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class TokenUsageRecorder:
+    """Keep recent eval_count samples per mode/complexity and optionally append them to a JSONL file"""
+
+    def __init__(self, log_path=None, max_samples=500):
+        self.log_path = log_path
+        self.max_samples = max_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, complexity, num_predict, result):
+        """Record the token usage reported in an Ollama /api/generate response"""
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "mode": mode,
+            "complexity": complexity,
+            "num_predict": num_predict,
+            "eval_count": result.get("eval_count"),
+            "prompt_eval_count": result.get("prompt_eval_count"),
+            "done_reason": result.get("done_reason"),
+            "model": result.get("model")
+        }
+
+        with self._lock:
+            key = (mode, complexity)
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.max_samples)
+            self._samples[key].append(entry)
+
+            if self.log_path:
+                try:
+                    with open(self.log_path, 'a', encoding='utf-8') as log_file:
+                        log_file.write(json.dumps(entry) + '\n')
+                except OSError as e:
+                    logger.warning(f"Could not write token usage log: {e}")
+
+        return entry
+
+    def summary(self):
+        """Summarize recorded eval_count per mode and complexity"""
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+
+        summary = {}
+        for (mode, complexity), samples in sorted(snapshot.items()):
+            counts = sorted(s["eval_count"] for s in samples if s["eval_count"] is not None)
+            summary.setdefault(mode, {})[complexity] = {
+                "requests": len(samples),
+                "num_predict": samples[-1]["num_predict"],
+                "eval_count_mean": round(sum(counts) / len(counts), 1) if counts else None,
+                "eval_count_p50": _percentile(counts, 0.5),
+                "eval_count_p95": _percentile(counts, 0.95),
+                "eval_count_max": counts[-1] if counts else None,
+                # done_reason "length" means the budget cut the answer short
+                "truncated": sum(1 for s in samples if s["done_reason"] == "length")
+            }
+        return summary
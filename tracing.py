@@ -0,0 +1,188 @@
+"""
+equalearn.ai. Request tracing
+Records timed spans for the stages of a request, renders them as a
+Server-Timing header or JSON block, and can append sampled traces to a
+file in OTLP JSON format (one ExportTraceServiceRequest per line).
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar("equalearn_trace", default=None)
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """One timed stage of a request"""
+
+    def __init__(self, name, parent_id, start_ns, attributes=None):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans recorded for a single request"""
+
+    def __init__(self, name, request_id, sampled):
+        self.trace_id = _new_id(16)
+        self.request_id = request_id
+        self.sampled = sampled
+        self.root = Span(name, None, time.time_ns())
+        self.spans = []
+        self._stack = [self.root]
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not self.sampled:
+            yield None
+            return
+        span = Span(name, self._stack[-1].span_id, time.time_ns(), attributes)
+        self._stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end_ns = time.time_ns()
+            self._stack.pop()
+            self.spans.append(span)
+
+    def add_span(self, name, start_ns, duration_ns, parent=None, **attributes):
+        """Record a span measured elsewhere, e.g. durations reported by Ollama"""
+        if not self.sampled or duration_ns is None or duration_ns < 0:
+            return None
+        span = Span(name, (parent or self._stack[-1]).span_id, int(start_ns), attributes)
+        span.end_ns = int(start_ns + duration_ns)
+        self.spans.append(span)
+        return span
+
+    def finish(self, **attributes):
+        self.root.end_ns = time.time_ns()
+        self.root.attributes.update(attributes)
+
+    def server_timing(self):
+        """Format spans as a Server-Timing header value, summing repeated stage names"""
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration_ms
+        metrics = [f"{name};dur={ms:.1f}" for name, ms in totals.items()]
+        metrics.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(metrics)
+
+    def to_dict(self):
+        """Timing breakdown for the optional JSON response block"""
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "total_ms": round(self.root.duration_ms, 1),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.start_ns - self.root.start_ns) / 1e6, 1),
+                    "duration_ms": round(span.duration_ms, 1),
+                    **({"attributes": span.attributes} if span.attributes else {})
+                }
+                for span in sorted(self.spans, key=lambda s: s.start_ns)
+            ]
+        }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace, span, kind):
+    otlp = {
+        "traceId": trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()]
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+
+class Tracer:
+    """Start, sample and export request traces"""
+
+    SPAN_KIND_INTERNAL = 1
+    SPAN_KIND_SERVER = 2
+
+    def __init__(self, sample_rate=1.0, export_path=None, service_name="equalearn.ai"):
+        self.sample_rate = sample_rate
+        self.export_path = export_path
+        self.service_name = service_name
+        self._export_lock = threading.Lock()
+
+    def start(self, name, request_id, force_sample=False):
+        """Begin a trace for the current request and make it current"""
+        sampled = force_sample or random.random() < self.sample_rate
+        trace = Trace(name, request_id, sampled)
+        token = _current_trace.set(trace)
+        return trace, token
+
+    def end(self, token):
+        _current_trace.reset(token)
+
+    def current(self):
+        return _current_trace.get()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block as a child of the current span; no-op outside a sampled trace"""
+        trace = _current_trace.get()
+        if trace is None:
+            yield None
+            return
+        with trace.span(name, **attributes) as span:
+            yield span
+
+    def export(self, trace):
+        """Append a finished, sampled trace to the export file as OTLP JSON"""
+        if not self.export_path or not trace.sampled:
+            return
+
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "equalearn.tracing"},
+                    "spans": [_otlp_span(trace, trace.root, self.SPAN_KIND_SERVER)] +
+                             [_otlp_span(trace, span, self.SPAN_KIND_INTERNAL) for span in trace.spans]
+                }]
+            }]
+        }
+
+        try:
+            with self._export_lock:
+                with open(self.export_path, 'a', encoding='utf-8') as export_file:
+                    export_file.write(json.dumps(request) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not export trace: {e}")